@@ -78,7 +78,15 @@ def main() -> None:
     """Main program logic. Start the event loop, parse the CLI arguments and
     run the game.
     """
-    loop = asyncio.new_event_loop()
+    try:
+        import uvloop
+    except ImportError:
+        loop = asyncio.new_event_loop()
+    else:
+        loop = uvloop.new_event_loop()
+    # before Python 3.10 asyncio primitives bind to the current event loop
+    # when they are created, not when they are first awaited
+    asyncio.set_event_loop(loop)
     args = parse_args()
 
     if args.list:
@@ -96,6 +104,7 @@ def main() -> None:
             corpus=corpus,
             max_time=args.time,
             rigorous_spaces=args.rigorous_spaces,
+            width=args.width,
         )
 
         loop.run_until_complete(
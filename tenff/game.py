@@ -1,23 +1,25 @@
 """Game logic."""
 import asyncio
 import random
-import re
 import shutil
+import signal
 import time
 import typing as T
 from dataclasses import dataclass
 from enum import IntEnum
 
 from tenff.terminal import (
+    ERASE_WHOLE_LINE,
+    TEXT_COLOR_CODES,
     TerminalInputHandler,
     TextColor,
-    erase_whole_line,
-    move_cursor_up,
-    set_text_color,
+    cursor_down_code,
+    cursor_forward_code,
+    cursor_up_code,
+    write_output,
 )
-from tenff.util import divide_lines
+from tenff.util import divide_lines, get_display_width
 
-MAX_COLUMNS = min(shutil.get_terminal_size().columns, 80)
 MAX_DISPLAY_LINES = 2
 SAMPLE_SIZE = 1000
 AVG_WORD_LENGTH = 5
@@ -33,12 +35,41 @@ class WordStatus(IntEnum):
     TYPED_WRONG = 4
 
 
-@dataclass
-class Word:
-    """A single word in context of a running game."""
-
-    text: str
-    status: WordStatus
+STYLE_PREFIX: dict[int, bytes] = {
+    WordStatus.UNTYPED: TEXT_COLOR_CODES[TextColor.DEFAULT],
+    WordStatus.TYPING_WELL: TEXT_COLOR_CODES[TextColor.YELLOW],
+    WordStatus.TYPING_WRONG: TEXT_COLOR_CODES[TextColor.RED],
+    WordStatus.TYPED_WELL: TEXT_COLOR_CODES[TextColor.GREEN],
+    WordStatus.TYPED_WRONG: TEXT_COLOR_CODES[TextColor.RED],
+}
+
+STATS_TEMPLATE = (
+    b"".join(
+        ERASE_WHOLE_LINE + line + b"\n"
+        for line in (
+            b"CPS (chars per second): %.1f",
+            b"WPM (words per minute): %.1f",
+            b"Characters typed:       %d ("
+            + TEXT_COLOR_CODES[TextColor.GREEN]
+            + b"%d|"
+            + TEXT_COLOR_CODES[TextColor.RED]
+            + b"%d"
+            + TEXT_COLOR_CODES[TextColor.DEFAULT]
+            + b")",
+            b"Keys pressed:           %d",
+            b"Accuracy:               %.1f%%",
+            b"Correct words:          "
+            + TEXT_COLOR_CODES[TextColor.GREEN]
+            + b"%d"
+            + TEXT_COLOR_CODES[TextColor.DEFAULT],
+            b"Wrong words:            "
+            + TEXT_COLOR_CODES[TextColor.RED]
+            + b"%d"
+            + TEXT_COLOR_CODES[TextColor.DEFAULT],
+        )
+    )
+    + ERASE_WHOLE_LINE
+)
 
 
 @dataclass
@@ -48,77 +79,128 @@ class GameSettings:
     corpus: list[str]
     max_time: int
     rigorous_spaces: bool
+    width: int
+
+
+def get_max_columns(width: int) -> int:
+    """Return how many columns the game lines can span.
+
+    :param width: requested game width.
+    :return: the requested width limited to the terminal width.
+    """
+    return min(width, shutil.get_terminal_size().columns)
 
 
 class GameState:
     """The game state. Does not manipulate itself."""
 
-    def __init__(self, words: list[str], max_time: int) -> None:
+    def __init__(
+        self, words: list[str], max_time: int, max_columns: int
+    ) -> None:
         """Initialize self.
 
         :param words: full list of words to type for this game.
         :param max_time: maximum time for this game.
+        :param max_columns: maximum columns that can fit in a single line.
         """
-        self.words = [
-            Word(
-                text=word,
-                status=WordStatus.TYPING_WELL
-                if i == 0
-                else WordStatus.UNTYPED,
-            )
-            for i, word in enumerate(words)
-        ]
+        self.words = words
+        self.statuses = bytearray(len(words))
+        self.statuses[0] = WordStatus.TYPING_WELL
+        self.encoded_words = [word.encode() for word in words]
+        self.word_widths = [get_display_width(word) for word in words]
         self.current_word_index = 0
-        self.word_input = ""
-        self.line_boundaries = divide_lines(words, MAX_COLUMNS)
+        self.current_word = words[0]
+        self.word_input_chars: list[str] = []
+        self.word_match_length = 0
+        self.num_words = len(words)
+        self.lay_out(max_columns)
+
         self.time_left = max_time
         self.start_time: T.Optional[float] = None
         self.end_time: T.Optional[float] = None
+        self.is_started = False
+        self.is_finished = False
+        self.deadline: T.Optional[float] = None
         self.keys_pressed = 0
         self.current_word_keys_pressed = 0
-        self.first_render = True
-        self.timer_future: T.Optional[asyncio.Task[None]] = None
-
-    @property
-    def is_started(self) -> bool:
-        """Return whether the game has run out of time.
-
-        :return: whether the game has ended.
+        self.correct_words = 0
+        self.wrong_words = 0
+        self.correct_characters = 0
+        self.wrong_characters = 0
+        self.last_render_signature: T.Optional[
+            tuple[int, T.Optional[int]]
+        ] = None
+        self.last_rendered_time_left: T.Optional[int] = None
+        self.timer_handle: T.Optional[asyncio.TimerHandle] = None
+        self.finished_event = asyncio.Event()
+
+    def lay_out(self, max_columns: int) -> None:
+        """Divide the words into lines and prepare their rendering.
+
+        :param max_columns: maximum columns that can fit in a single line.
         """
-        return self.start_time is not None
-
-    @property
-    def is_finished(self) -> bool:
-        """Return whether the game has run out of time.
-
-        :return: whether the game has ended.
-        """
-        return self.end_time is not None
+        self.max_columns = max_columns
+        # words of unknown width are assumed to take a column per character
+        self.line_boundaries = divide_lines(
+            [
+                len(word) if width is None else width
+                for word, width in zip(self.words, self.word_widths)
+            ],
+            max_columns,
+        )
+        self.num_lines = len(self.line_boundaries)
+
+        # every word past the current one is untyped, so the tail of each
+        # line always looks the same and can be rendered up front
+        self.encoded_lines: list[bytes] = []
+        self.word_offsets: list[int] = []
+        self.word_columns: list[int] = []
+        self.line_columns_known: list[bool] = []
+        for low, high in self.line_boundaries:
+            offset = 0
+            column = 0
+            columns_known = True
+            for idx in range(low, high):
+                self.word_offsets.append(offset)
+                self.word_columns.append(column)
+                offset += len(self.encoded_words[idx]) + 1
+                width = self.word_widths[idx]
+                if width is None:
+                    columns_known = False
+                else:
+                    column += width + 1
+            self.line_columns_known.append(columns_known)
+            self.encoded_lines.append(
+                b"".join(
+                    encoded_word + b" "
+                    for encoded_word in self.encoded_words[low:high]
+                )
+            )
 
-    @property
-    def current_line(self) -> int:
-        """Current line number within all of the game lines."""
-        for i, (low, high) in enumerate(self.line_boundaries):
-            if self.current_word_index in range(low, high):
-                return i
-        return len(self.line_boundaries) - 1
+        self.current_line = 0
+        while (
+            self.current_line + 1 < self.num_lines
+            and self.current_word_index
+            >= self.line_boundaries[self.current_line][1]
+        ):
+            self.current_line += 1
+        self.layout_changed = True
 
     @property
-    def current_word(self) -> Word:
-        """Currently typed word."""
-        return self.words[self.current_word_index]
+    def word_input(self) -> str:
+        """Text typed so far for the current word."""
+        return "".join(self.word_input_chars)
 
     @property
-    def shown_line_boundaries(self) -> T.Iterable[tuple[int, int]]:
-        """Line boundaries within viewport.
+    def shown_lines(self) -> range:
+        """Lines within viewport.
 
-        :return: list of tuples with low and high indices of the game words
-                 to render.
+        :return: range of indices of the game lines to render.
         """
-        current = self.current_line
-        for i in range(MAX_DISPLAY_LINES):
-            if current + i in range(len(self.line_boundaries)):
-                yield self.line_boundaries[current + i]
+        return range(
+            self.current_line,
+            min(self.current_line + MAX_DISPLAY_LINES, self.num_lines),
+        )
 
 
 class GameExecutor:
@@ -139,84 +221,111 @@ class GameExecutor:
         self.loop = loop
         self.state = state
         self.settings = settings
+        self.control_key_handlers: dict[str, T.Callable[[], None]] = {
+            "\x03": self.finish,  # ^C
+            "\x7F": self.backspace_pressed,  # ^H
+            "\x17": self.word_backspace_pressed,  # ^W
+        }
 
     def start(self) -> None:
         """Start the game timer."""
-        self.state.start_time = time.time()
+        # the event loop clock only drives the timer; its resolution is too
+        # coarse with some loops to measure the game duration with
+        self.state.start_time = time.perf_counter()
+        self.state.is_started = True
+        self.state.deadline = self.loop.time() + self.state.time_left
+        self.schedule_tick()
+
+    def schedule_tick(self) -> None:
+        """Schedule the next tick relative to the game deadline, so that late
+        callbacks do not make the game last longer.
+        """
+        assert self.state.deadline is not None
+        self.state.timer_handle = self.loop.call_at(
+            self.state.deadline - self.state.time_left + 1, self.tick
+        )
 
     def finish(self) -> None:
         """Stop the game timer."""
-        self.state.end_time = time.time()
-        if self.state.timer_future is not None:
-            self.state.timer_future.cancel()
+        self.state.end_time = time.perf_counter()
+        self.state.is_finished = True
+        self.state.finished_event.set()
+        if self.state.timer_handle is not None:
+            self.state.timer_handle.cancel()
 
     def tick(self) -> None:
-        """Decrease time left by 1 second."""
+        """Decrease time left by 1 second and schedule the next tick."""
         self.state.time_left -= 1
         if self.state.time_left == 0:
             self.finish()
+        else:
+            self.schedule_tick()
+        self.render()
+
+    def resize(self) -> None:
+        """Lay out the words again to fit the resized terminal."""
+        max_columns = get_max_columns(self.settings.width)
+        if max_columns != self.state.max_columns:
+            self.state.lay_out(max_columns)
+            self.render()
 
     def consume_key(self, key: str) -> bool:
         """Consume user key.
 
-        :param key: key to handle.
+        :param key: single character of user input to handle.
         """
-        if key == "\x03":  # ^C
-            self.finish()
-        elif key == "\x7F":  # ^H
-            self.backspace_pressed()
-        elif key == "\x17":  # ^W
-            self.word_backspace_pressed()
-        elif re.match(r"\s", key):
-            if self.state.word_input != "" or self.settings.rigorous_spaces:
-                self.word_finished()
-        elif len(key) > 1 or ord(key) >= 32:
-            self.key_pressed(key)
-
         if not self.state.is_started:
             self.start()
-            self.state.timer_future = asyncio.ensure_future(
-                self.timer(), loop=self.loop
-            )
 
-        return True
+        handler = self.control_key_handlers.get(key)
+        if handler is not None:
+            handler()
+        elif key.isspace():
+            if self.state.word_input_chars or self.settings.rigorous_spaces:
+                self.word_finished()
+        elif ord(key) >= 32:
+            self.key_pressed(key)
 
-    async def timer(self) -> None:
-        """Track the game progress."""
-        while not self.state.is_finished:
-            try:
-                await asyncio.sleep(1)
-            except asyncio.CancelledError:
-                break
-            self.tick()
-            self.render()
+        return True
 
     def update_typing_status(self) -> None:
         """Update the interal list of word states."""
-        self.state.current_word.status = (
+        self.state.statuses[self.state.current_word_index] = (
             WordStatus.TYPING_WELL
-            if self.state.current_word.text.startswith(self.state.word_input)
+            if self.state.word_match_length == len(self.state.word_input_chars)
             else WordStatus.TYPING_WRONG
         )
 
     def backspace_pressed(self) -> None:
         """Delete the last character."""
-        self.state.word_input = self.state.word_input[:-1]
+        if self.state.word_input_chars:
+            self.state.word_input_chars.pop()
+            self.state.word_match_length = min(
+                self.state.word_match_length, len(self.state.word_input_chars)
+            )
         self.state.current_word_keys_pressed += 1
         self.update_typing_status()
 
     def word_backspace_pressed(self) -> None:
         """Delete the last word."""
-        self.state.word_input = ""
+        self.state.word_input_chars.clear()
+        self.state.word_match_length = 0
         self.state.current_word_keys_pressed += 1
         self.update_typing_status()
 
     def key_pressed(self, key: str) -> None:
-        """Append the given key to the current word.
+        """Append the given character to the current word.
 
-        :param key: key the user pressed.
+        :param key: character the user typed.
         """
-        self.state.word_input += key
+        # the input matches the word as long as every typed character did
+        if self.state.word_match_length == len(
+            self.state.word_input_chars
+        ) and self.state.current_word.startswith(
+            key, self.state.word_match_length
+        ):
+            self.state.word_match_length += 1
+        self.state.word_input_chars.append(key)
         self.state.current_word_keys_pressed += 1
         self.update_typing_status()
 
@@ -226,69 +335,159 @@ class GameExecutor:
         """
         self.state.keys_pressed += self.state.current_word_keys_pressed + 1
         self.state.current_word_keys_pressed = 0
-        self.state.current_word.status = (
-            WordStatus.TYPED_WELL
-            if self.state.current_word.text == self.state.word_input
-            else WordStatus.TYPED_WRONG
-        )
-        self.state.word_input = ""
+        word = self.state.current_word
+        if (
+            self.state.word_match_length
+            == len(self.state.word_input_chars)
+            == len(word)
+        ):
+            status = WordStatus.TYPED_WELL
+            self.state.correct_words += 1
+            self.state.correct_characters += len(word) + 1
+        else:
+            status = WordStatus.TYPED_WRONG
+            self.state.wrong_words += 1
+            self.state.wrong_characters += len(word) + 1
+        self.state.statuses[self.state.current_word_index] = status
+        self.state.word_input_chars.clear()
+        self.state.word_match_length = 0
 
         self.state.current_word_index += 1
-        if self.state.current_word_index == len(self.state.words):
+        while (
+            self.state.current_line + 1 < self.state.num_lines
+            and self.state.current_word_index
+            >= self.state.line_boundaries[self.state.current_line][1]
+        ):
+            self.state.current_line += 1
+
+        if self.state.current_word_index == self.state.num_words:
             self.finish()
         else:
-            self.state.current_word.status = WordStatus.TYPING_WELL
+            self.state.current_word = self.state.words[
+                self.state.current_word_index
+            ]
+            self.state.statuses[
+                self.state.current_word_index
+            ] = WordStatus.TYPING_WELL
 
     def render(self) -> None:
         """Render the game text up to MAX_DISPLAY_LINES together with a timer."""
-        shown_line_boundaries = list(self.state.shown_line_boundaries)
-        if not self.state.first_render:
-            move_cursor_up(MAX_DISPLAY_LINES + 1)
-        self.state.first_render = False
-
-        for i in range(MAX_DISPLAY_LINES):
-            erase_whole_line()
-            if i in range(len(shown_line_boundaries)):
-                low, high = shown_line_boundaries[i]
-                for idx in range(low, high):
-                    set_text_color(
-                        {
-                            WordStatus.TYPING_WELL: TextColor.YELLOW,
-                            WordStatus.TYPING_WRONG: TextColor.RED,
-                            WordStatus.TYPED_WELL: TextColor.GREEN,
-                            WordStatus.TYPED_WRONG: TextColor.RED,
-                        }.get(self.state.words[idx].status, TextColor.DEFAULT)
-                    )
-                    print(self.state.words[idx].text, end="")
-                    print(end=" ")
-            print()
-        erase_whole_line()
-        print("--- ({} s left) ---".format(self.state.time_left))
-        erase_whole_line()
-        print(self.state.word_input, end="", flush=True)
+        buf = bytearray()
+
+        # the word lines only need to be redrawn when the current line or the
+        # layout changes, only the words whose status changed when moving
+        # within the line or typing, and the timer when the time left changes
+        index = self.state.current_word_index
+        status = (
+            self.state.statuses[index]
+            if index < self.state.num_words
+            else None
+        )
+        last_signature = self.state.last_render_signature
+        self.state.last_render_signature = (index, status)
+        layout_changed = self.state.layout_changed
+        self.state.layout_changed = False
+        columns_known = self.state.line_columns_known[self.state.current_line]
+        redraw_words = (
+            layout_changed
+            or last_signature is None
+            or last_signature[0] != index
+            # repainting a single word in place needs to know its column
+            or (not columns_known and last_signature[1] != status)
+        )
+        advanced_in_line = (
+            redraw_words
+            and columns_known
+            and not layout_changed
+            and last_signature is not None
+            and last_signature[0] == index - 1
+            and index < self.state.num_words
+            and index > self.state.line_boundaries[self.state.current_line][0]
+        )
+        redraw_current_word = advanced_in_line or (
+            not redraw_words
+            and last_signature is not None
+            and last_signature[1] != status
+        )
+        redraw_timer = (
+            redraw_words and not advanced_in_line
+        ) or self.state.time_left != self.state.last_rendered_time_left
+
+        if redraw_current_word:
+            # words are only repainted in place over a previous render, while
+            # there is still a word to type
+            assert last_signature is not None and status is not None
+            # the current word is always on the first displayed line, right
+            # after the word typed before it
+            buf += cursor_up_code(MAX_DISPLAY_LINES + 1)
+            if advanced_in_line:
+                buf += cursor_forward_code(self.state.word_columns[index - 1])
+                buf += STYLE_PREFIX[self.state.statuses[index - 1]]
+                buf += self.state.encoded_words[index - 1]
+                buf += b" "
+            else:
+                buf += cursor_forward_code(self.state.word_columns[index])
+            buf += STYLE_PREFIX[status]
+            buf += self.state.encoded_words[index]
+            buf += TEXT_COLOR_CODES[TextColor.DEFAULT]
+            buf += cursor_down_code(
+                MAX_DISPLAY_LINES if redraw_timer else MAX_DISPLAY_LINES + 1
+            )
+        elif redraw_words:
+            if last_signature is not None:
+                buf += cursor_up_code(MAX_DISPLAY_LINES + 1)
+
+            shown_lines = self.state.shown_lines
+            last_prefix = TEXT_COLOR_CODES[TextColor.DEFAULT]
+            for i in range(MAX_DISPLAY_LINES):
+                buf += ERASE_WHOLE_LINE
+                if i < len(shown_lines):
+                    line = shown_lines[i]
+                    low, high = self.state.line_boundaries[line]
+                    if line == self.state.current_line:
+                        end = min(index + 1, high)
+                        while low < end:
+                            prefix = STYLE_PREFIX[self.state.statuses[low]]
+                            if prefix != last_prefix:
+                                buf += prefix
+                                last_prefix = prefix
+                            buf += self.state.encoded_words[low]
+                            buf += b" "
+                            low += 1
+                    if low < high:
+                        prefix = STYLE_PREFIX[WordStatus.UNTYPED]
+                        if prefix != last_prefix:
+                            buf += prefix
+                            last_prefix = prefix
+                        buf += self.state.encoded_lines[line][
+                            self.state.word_offsets[low] :
+                        ]
+                buf += b"\n"
+            if last_prefix != TEXT_COLOR_CODES[TextColor.DEFAULT]:
+                buf += TEXT_COLOR_CODES[TextColor.DEFAULT]
+        elif redraw_timer:
+            buf += cursor_up_code(1)
+
+        if redraw_timer:
+            self.state.last_rendered_time_left = self.state.time_left
+            buf += ERASE_WHOLE_LINE
+            buf += b"--- (%d s left) ---\n" % self.state.time_left
+
+        buf += ERASE_WHOLE_LINE
+        buf += self.state.word_input.encode()
+        write_output(buf)
 
     def render_stats(self) -> None:
         """Render final game statistics."""
-        correct_words = [
-            word.text
-            for word in self.state.words
-            if word.status == WordStatus.TYPED_WELL
-        ]
-        wrong_words = [
-            word.text
-            for word in self.state.words
-            if word.status == WordStatus.TYPED_WRONG
-        ]
-        correct_characters = sum(len(word) + 1 for word in correct_words)
-        wrong_characters = sum(len(word) + 1 for word in wrong_words)
+        correct_characters = self.state.correct_characters
+        wrong_characters = self.state.wrong_characters
         total_characters = correct_characters + wrong_characters
 
         if self.state.end_time is None or self.state.start_time is None:
-            cps = 0.0
+            duration = 0.0
         else:
-            cps = correct_characters / (
-                self.state.end_time - self.state.start_time
-            )
+            duration = self.state.end_time - self.state.start_time
+        cps = correct_characters / duration if duration > 0 else 0.0
         wpm = cps * 60.0 / AVG_WORD_LENGTH
         accuracy = (
             correct_characters / self.state.keys_pressed
@@ -296,41 +495,20 @@ class GameExecutor:
             else 1
         )
 
-        erase_whole_line()
-
-        print("CPS (chars per second): {:.1f}".format(cps))
-        erase_whole_line()
-        print("WPM (words per minute): {:.1f}".format(wpm))
-
-        erase_whole_line()
-        print("Characters typed:       {} (".format(total_characters), end="")
-        set_text_color(TextColor.GREEN)
-        print(correct_characters, end="|")
-        set_text_color(TextColor.RED)
-        print(wrong_characters, end="")
-        set_text_color(TextColor.DEFAULT)
-        print(")")
-
-        erase_whole_line()
-        print("Keys pressed:           {}".format(self.state.keys_pressed))
-        erase_whole_line()
-        print("Accuracy:               {:.1%}".format(accuracy))
-
-        erase_whole_line()
-        print(r"Correct words:          ", end="")
-        set_text_color(TextColor.GREEN)
-        print(len(correct_words), end="")
-        set_text_color(TextColor.DEFAULT)
-        print()
-
-        erase_whole_line()
-        print(r"Wrong words:            ", end="")
-        set_text_color(TextColor.RED)
-        print(len(wrong_words), end="")
-        set_text_color(TextColor.DEFAULT)
-
-        erase_whole_line()
-        print()
+        write_output(
+            STATS_TEMPLATE
+            % (
+                cps,
+                wpm,
+                total_characters,
+                correct_characters,
+                wrong_characters,
+                self.state.keys_pressed,
+                accuracy * 100,
+                self.state.correct_words,
+                self.state.wrong_words,
+            )
+        )
 
 
 async def run_game(
@@ -344,22 +522,25 @@ async def run_game(
     :param input_handler: input handler instance.
     :param settings: game settings.
     """
-    all_words = [random.choice(settings.corpus) for _i in range(SAMPLE_SIZE)]
-    state = GameState(all_words, settings.max_time)
+    all_words = random.choices(settings.corpus, k=SAMPLE_SIZE)
+    max_columns = get_max_columns(settings.width)
+    state = GameState(all_words, settings.max_time, max_columns)
     executor = GameExecutor(loop, state, settings)
+    loop.add_signal_handler(signal.SIGWINCH, executor.resize)
 
+    finished_future = loop.create_task(state.finished_event.wait())
     while not state.is_finished:
         executor.render()
-        try:
-            key = input_handler.input_queue.get_nowait()
-        except asyncio.QueueEmpty:
-            await asyncio.sleep(0.05)
+        key_future = loop.create_task(input_handler.input_queue.get())
+        await asyncio.wait(
+            {key_future, finished_future},
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        if state.is_finished:
+            key_future.cancel()
         else:
-            executor.consume_key(key)
+            executor.consume_key(key_future.result())
+    await finished_future
+    loop.remove_signal_handler(signal.SIGWINCH)
 
-    assert state.timer_future is not None
-    try:
-        await state.timer_future
-    except asyncio.CancelledError:
-        pass
     executor.render_stats()
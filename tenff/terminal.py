@@ -1,5 +1,6 @@
 """Terminal manipulation utilities."""
 import asyncio
+import codecs
 import contextlib
 import os
 import sys
@@ -8,6 +9,8 @@ import tty
 import typing as T
 from enum import IntEnum
 
+INPUT_CHUNK_SIZE = 1024
+
 
 class TextColor(IntEnum):
     """Text color."""
@@ -18,31 +21,53 @@ class TextColor(IntEnum):
     DEFAULT = 4
 
 
-def move_cursor_up(num: int) -> None:
-    """Move the caret up by the specified number of lines.
+TEXT_COLOR_CODES = {
+    TextColor.RED: b"\x1B[31;1m",
+    TextColor.GREEN: b"\x1B[32;1m",
+    TextColor.YELLOW: b"\x1B[33;1m",
+    TextColor.DEFAULT: b"\x1B[0m",
+}
+ERASE_WHOLE_LINE = b"\x1B[999D\x1B[K"
+
+
+def cursor_up_code(num: int) -> bytes:
+    """Return the sequence that moves the caret up by the specified number of
+    lines.
+
+    :param num: how many lines to go.
+    :return: the escape sequence.
+    """
+    return b"\x1B[%dF" % num
+
+
+def cursor_down_code(num: int) -> bytes:
+    """Return the sequence that moves the caret down by the specified number
+    of lines, to the beginning of the line.
 
     :param num: how many lines to go.
+    :return: the escape sequence.
     """
-    sys.stdout.write("\x1B[{}F".format(num))
+    return b"\x1B[%dE" % num
+
 
+def cursor_forward_code(num: int) -> bytes:
+    """Return the sequence that moves the caret right by the specified number
+    of columns.
 
-def set_text_color(color: TextColor) -> None:
-    """Change the color of the text to the given value.
+    :param num: how many columns to go.
+    :return: the escape sequence.
+    """
+    return b"\x1B[%dC" % num if num else b""
 
-    :param color: color to set"""
-    sys.stdout.write(
-        {
-            TextColor.RED: "\x1B[31;1m",
-            TextColor.GREEN: "\x1B[32;1m",
-            TextColor.YELLOW: "\x1B[33;1m",
-            TextColor.DEFAULT: "\x1B[0m",
-        }[color]
-    )
 
+def write_output(data: T.Union[bytes, bytearray]) -> None:
+    """Write the given bytes to the standard output in one go and flush it.
 
-def erase_whole_line() -> None:
-    """Erase the entire line where the caret is at."""
-    sys.stdout.write("\x1B[999D\x1B[K")
+    :param data: bytes to write.
+    """
+    sys.stdout.flush()
+    sys.stdout.buffer.write(data)
+    sys.stdout.buffer.flush()
 
 
 class TerminalInputHandler:
@@ -54,10 +79,10 @@ class TerminalInputHandler:
         :param loop: the event loop.
         """
         self.fd = sys.stdin.fileno()
-        self.loop = loop
         self.old_settings: T.Optional[T.List[T.Any]] = None
 
         self.input_queue: asyncio.Queue[str] = asyncio.Queue()
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
         loop.add_reader(sys.stdin, self.got_input)
 
     @contextlib.contextmanager
@@ -83,12 +108,9 @@ class TerminalInputHandler:
                 )
 
     def got_input(self) -> None:
-        """Handle the keypress event."""
-        keys_raw = b""
-        key = os.read(self.fd, 1)
-        while key is not None and len(key) > 0:
-            keys_raw += key
-            key = os.read(self.fd, 1)
-        keys_str = keys_raw.decode()
-
-        asyncio.ensure_future(self.input_queue.put(keys_str), loop=self.loop)
+        """Handle the keypress event. Enqueue the available input one
+        character at a time.
+        """
+        keys_raw = os.read(self.fd, INPUT_CHUNK_SIZE)
+        for key in self.decoder.decode(keys_raw):
+            self.input_queue.put_nowait(key)
@@ -1,5 +1,6 @@
 """Miscellaneous utility functions."""
-import re
+import typing as T
+import unicodedata
 from pathlib import Path
 
 CORPORA_PATH = Path(__file__).parent / "data"
@@ -24,31 +25,55 @@ def parse_corpus(corpus_path: Path) -> list[str]:
     :param corpus_path: path to the corpus.
     :return: list of words within the file.
     """
-    return [
-        word
-        for word in re.split(r"\s+", corpus_path.read_text(encoding="utf-8"))
-        if word
-    ]
+    # decoding the raw bytes skips the newline translation of the text
+    # layer, which is irrelevant once the text is split on whitespace
+    return corpus_path.read_bytes().decode("utf-8").split()
 
 
-def divide_lines(words: list[str], max_columns: int) -> list[tuple[int, int]]:
-    """Divide words into lines.
+def get_display_width(text: str) -> T.Optional[int]:
+    """Get the number of terminal columns the given text occupies.
 
+    :param text: the text to measure.
+    :return: the width of the text, or None if terminals do not agree on how
+        wide some of its characters are.
+    """
+    if text.isascii():
+        return len(text)
+    width = 0
+    for char in text:
+        category = unicodedata.category(char)
+        if category == "Mc":
+            # spacing combining marks take a column in some terminals and
+            # are merged with the preceding character in others
+            return None
+        if category in ("Mn", "Me", "Cf"):
+            continue
+        width += 2 if unicodedata.east_asian_width(char) in ("W", "F") else 1
+    return width
+
+
+def divide_lines(
+    word_widths: list[int], max_columns: int
+) -> list[tuple[int, int]]:
+    """Divide words into lines. A word that does not fit within max_columns
+    is put on a line of its own.
+
+    :param word_widths: display widths of the words to divide.
     :param max_columns: maximum columns that can fit in a single line.
     :return: list of lines with indices of the input text.
     """
     lines = []
-    words_left = words[:]
-    while len(words_left):
-        current_line = ""
-        low = len(words) - len(words_left)
-        while len(words_left):
-            word = words_left[0]
-            new_line = " ".join((current_line, word)).strip()
-            if len(new_line) >= max_columns:
-                break
-            words_left = words_left[1:]
-            current_line = new_line
-        high = len(words) - len(words_left)
+    num_words = len(word_widths)
+    high = 0
+    while high < num_words:
+        low = high
+        line_width = word_widths[high]
+        high += 1
+        while (
+            high < num_words
+            and line_width + 1 + word_widths[high] < max_columns
+        ):
+            line_width += 1 + word_widths[high]
+            high += 1
         lines.append((low, high))
     return lines